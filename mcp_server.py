@@ -4,9 +4,13 @@ This server exposes the documentation generation functionality as MCP tools
 that can be used directly in Cursor.
 """
 import asyncio
+import functools
+import logging
 import sys
-from typing import Any, Sequence, Optional
-import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Sequence, Optional
+import orjson
 
 # MCP servers must ONLY output JSON-RPC messages to stdout
 # All error messages must go to stderr to avoid breaking the protocol
@@ -21,287 +25,374 @@ except ImportError as e:
     sys.stderr.flush()
     sys.exit(1)
 
-# Initialize components with error handling
-orchestrator: Optional[Any] = None
-git_handler: Optional[Any] = None
-
+# uvloop is optional (it has no Windows build); fall back to the stdlib loop
 try:
-    from src.orchestrator import MCPOrchestrator
-    from src.git_handler import GitHandler
-    from src.config import config
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Components are built on first use so the server can answer the MCP
+# handshake and list_tools before the Gemini/Daytona SDKs have loaded.
+@functools.lru_cache(maxsize=1)
+def get_orchestrator() -> Optional[Any]:
+    """Return the shared orchestrator, or None if it failed to initialize."""
+    try:
+        from src.orchestrator import MCPOrchestrator
+        return MCPOrchestrator()
+    except Exception as e:
+        sys.stderr.write(f"Warning: Error initializing orchestrator: {e}\n")
+        sys.stderr.write("MCP server will keep running but some features may not work.\n")
+        sys.stderr.flush()
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_git_handler() -> Optional[Any]:
+    """Return the shared Git handler, or None if it failed to initialize."""
+    try:
+        from src.git_handler import GitHandler
+        from src.config import get_config
+        return GitHandler(get_config().git_repo_path)
+    except Exception as e:
+        sys.stderr.write(f"Warning: Error initializing Git handler: {e}\n")
+        sys.stderr.write("MCP server will keep running but some features may not work.\n")
+        sys.stderr.flush()
+        return None
+
+
+# GitPython's Repo (its persistent cat-file pipe, the index lock) is not
+# thread-safe, so every call on the shared handler runs on this one thread
+_git_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="git")
+
+
+async def _run_git(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a Git handler call on the Git thread, one call at a time."""
+    return await asyncio.get_running_loop().run_in_executor(_git_executor, func, *args)
+
+
+# Identical process_code_changes requests that arrive while one is running
+# share its result instead of issuing another LLM call
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def _process_code_changes_shared(orchestrator: Any, diff_content: str, repo_path: str) -> Any:
+    """Run process_code_changes once per distinct in-flight (diff, repo) pair."""
+    from src.cache import diff_cache_key
     
-    orchestrator = MCPOrchestrator()
-    git_handler = GitHandler(config.git_repo_path)
-except Exception as e:
-    sys.stderr.write(f"Warning: Error initializing components: {e}\n")
-    sys.stderr.write("MCP server will start but some features may not work.\n")
-    sys.stderr.flush()
-    # Continue - server can still provide basic functionality
+    key = diff_cache_key(diff_content, repo_path)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(
+            asyncio.to_thread(orchestrator.process_code_changes, diff_content, repo_path)
+        )
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shield so one cancelled caller does not cancel the shared call
+    return await asyncio.shield(task)
+
 
 # Create MCP server
 server = Server("live-document-editor")
 
 
-@server.list_tools()
-async def list_tools() -> list[Tool]:
-    """List available MCP tools."""
-    return [
-        Tool(
-            name="process_code_changes",
-            description="Process Git code changes and generate documentation. Automatically analyzes code diffs, generates documentation using AI, evaluates quality, and provides the result.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "diff_content": {
-                        "type": "string",
-                        "description": "Git diff content to process. If empty, will fetch from current repository."
-                    },
-                    "repo_path": {
-                        "type": "string",
-                        "description": "Path to the repository (default: current directory)",
-                        "default": "."
-                    }
+# Tool definitions never change, so build them once at import
+_TOOLS: list[Tool] = [
+    Tool(
+        name="process_code_changes",
+        description="Process Git code changes and generate documentation. Automatically analyzes code diffs, generates documentation using AI, evaluates quality, and provides the result.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "diff_content": {
+                    "type": "string",
+                    "description": "Git diff content to process. If empty, will fetch from current repository."
                 },
-                "required": []
-            }
-        ),
-        Tool(
-            name="get_git_diff",
-            description="Get Git diff for the current repository. Returns uncommitted changes or diff against a branch.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "branch": {
-                        "type": "string",
-                        "description": "Branch to compare against (default: main)",
-                        "default": "main"
-                    },
-                    "uncommitted_only": {
-                        "type": "boolean",
-                        "description": "If true, only return uncommitted changes",
-                        "default": False
-                    }
+                "repo_path": {
+                    "type": "string",
+                    "description": "Path to the repository (default: current directory)",
+                    "default": "."
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="get_git_diff",
+        description="Get Git diff for the current repository. Returns uncommitted changes or diff against a branch.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "branch": {
+                    "type": "string",
+                    "description": "Branch to compare against (default: main)",
+                    "default": "main"
                 },
-                "required": []
-            }
-        ),
-        Tool(
-            name="update_documentation",
-            description="Update or create a documentation file with the provided content.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "file_path": {
-                        "type": "string",
-                        "description": "Path to the documentation file (e.g., DOCUMENTATION.md)"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "Documentation content in Markdown format"
-                    },
-                    "commit_message": {
-                        "type": "string",
-                        "description": "Git commit message (default: 'docs: Update documentation')",
-                        "default": "docs: Update documentation"
-                    }
+                "uncommitted_only": {
+                    "type": "boolean",
+                    "description": "If true, only return uncommitted changes",
+                    "default": False
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="update_documentation",
+        description="Update or create a documentation file with the provided content.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "file_path": {
+                    "type": "string",
+                    "description": "Path to the documentation file (e.g., DOCUMENTATION.md)"
                 },
-                "required": ["file_path", "content"]
-            }
-        ),
-        Tool(
-            name="commit_documentation",
-            description="Commit documentation changes to Git repository.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "file_path": {
-                        "type": "string",
-                        "description": "Path to the documentation file"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "Documentation content to commit"
-                    },
-                    "commit_message": {
-                        "type": "string",
-                        "description": "Git commit message",
-                        "default": "docs: Update documentation"
-                    }
+                "content": {
+                    "type": "string",
+                    "description": "Documentation content in Markdown format"
                 },
-                "required": ["file_path", "content"]
-            }
-        ),
-        Tool(
-            name="get_recent_commits",
-            description="Get recent Git commits from the repository.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of commits to retrieve (default: 10)",
-                        "default": 10
-                    }
+                "commit_message": {
+                    "type": "string",
+                    "description": "Git commit message (default: 'docs: Update documentation')",
+                    "default": "docs: Update documentation"
+                }
+            },
+            "required": ["file_path", "content"]
+        }
+    ),
+    Tool(
+        name="commit_documentation",
+        description="Commit documentation changes to Git repository.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "file_path": {
+                    "type": "string",
+                    "description": "Path to the documentation file"
                 },
-                "required": []
-            }
-        )
-    ]
+                "content": {
+                    "type": "string",
+                    "description": "Documentation content to commit"
+                },
+                "commit_message": {
+                    "type": "string",
+                    "description": "Git commit message",
+                    "default": "docs: Update documentation"
+                }
+            },
+            "required": ["file_path", "content"]
+        }
+    ),
+    Tool(
+        name="get_recent_commits",
+        description="Get recent Git commits from the repository.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "limit": {
+                    "type": "integer",
+                    "description": "Number of commits to retrieve (default: 10)",
+                    "default": 10
+                }
+            },
+            "required": []
+        }
+    )
+]
 
 
-@server.call_tool()
-async def call_tool(name: str, arguments: Any) -> Sequence[TextContent]:
-    """Handle tool calls."""
-    try:
-        if name == "process_code_changes":
-            if not orchestrator:
-                return [TextContent(
-                    type="text",
-                    text="Error: Orchestrator not initialized. Check server logs for details."
-                )]
-            
-            diff_content = arguments.get("diff_content", "")
-            repo_path = arguments.get("repo_path", ".")
-            
-            # If no diff provided, try to get from Git
-            if not diff_content or diff_content.strip() == "":
-                if not git_handler:
-                    return [TextContent(
-                        type="text",
-                        text="Error: Git handler not initialized. Cannot fetch Git diff."
-                    )]
-                diff_content = git_handler.get_uncommitted_changes()
-                if not diff_content or diff_content.strip() == "":
-                    from src.config import config
-                    diff_content = git_handler.get_diff(config.git_branch)
-            
-            if not diff_content or diff_content.strip() == "":
-                return [TextContent(
-                    type="text",
-                    text="No code changes found. Please make some changes to your code or provide a Git diff."
-                )]
-            
-            # Process code changes
-            update = orchestrator.process_code_changes(diff_content, repo_path)
-            
-            result = {
-                "documentation": update.content,
-                "file_path": update.file_path,
-                "evaluation_score": update.evaluation_score,
-                "ready_to_commit": update.ready_to_commit,
-                "code_snippets_count": len(update.code_snippets)
-            }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        
-        elif name == "get_git_diff":
-            if not git_handler:
-                return [TextContent(
-                    type="text",
-                    text="Error: Git handler not initialized. Check server logs for details."
-                )]
-            
-            branch = arguments.get("branch", "main")
-            uncommitted_only = arguments.get("uncommitted_only", False)
-            
-            if uncommitted_only:
-                diff = git_handler.get_uncommitted_changes()
-            else:
-                diff = git_handler.get_diff(branch)
-            
-            if not diff or diff.strip() == "":
-                return [TextContent(
-                    type="text",
-                    text="No changes found."
-                )]
-            
-            return [TextContent(
-                type="text",
-                text=diff
-            )]
-        
-        elif name == "update_documentation":
-            if not git_handler:
-                return [TextContent(
-                    type="text",
-                    text="Error: Git handler not initialized. Check server logs for details."
-                )]
-            
-            file_path = arguments["file_path"]
-            content = arguments["content"]
-            commit_message = arguments.get("commit_message", "docs: Update documentation")
-            
-            success = git_handler.commit_documentation(file_path, content, commit_message)
-            
-            if success:
-                return [TextContent(
-                    type="text",
-                    text=f"Documentation updated successfully: {file_path}"
-                )]
-            else:
-                return [TextContent(
-                    type="text",
-                    text=f"Failed to update documentation: {file_path}"
-                )]
-        
-        elif name == "commit_documentation":
-            if not git_handler:
-                return [TextContent(
-                    type="text",
-                    text="Error: Git handler not initialized. Check server logs for details."
-                )]
-            
-            file_path = arguments["file_path"]
-            content = arguments["content"]
-            commit_message = arguments.get("commit_message", "docs: Update documentation")
-            
-            success = git_handler.commit_documentation(file_path, content, commit_message)
-            
-            if success:
-                return [TextContent(
-                    type="text",
-                    text=f"Documentation committed successfully: {file_path}\nCommit message: {commit_message}"
-                )]
-            else:
-                return [TextContent(
-                    type="text",
-                    text=f"Failed to commit documentation: {file_path}"
-                )]
-        
-        elif name == "get_recent_commits":
-            if not git_handler:
-                return [TextContent(
-                    type="text",
-                    text="Error: Git handler not initialized. Check server logs for details."
-                )]
-            
-            limit = arguments.get("limit", 10)
-            commits = git_handler.get_recent_commits(limit)
-            
-            if not commits:
-                return [TextContent(
-                    type="text",
-                    text="No commits found."
-                )]
-            
-            result = json.dumps(commits, indent=2)
-            return [TextContent(
-                type="text",
-                text=result
-            )]
-        
-        else:
+@server.list_tools()
+async def list_tools() -> list[Tool]:
+    """List available MCP tools."""
+    return _TOOLS
+
+
+async def _handle_process_code_changes(arguments: Any) -> Sequence[TextContent]:
+    """Generate documentation for the given or current Git diff."""
+    orchestrator = get_orchestrator()
+    if not orchestrator:
+        return [TextContent(
+            type="text",
+            text="Error: Orchestrator not initialized. Check server logs for details."
+        )]
+    
+    diff_content = arguments.get("diff_content", "")
+    repo_path = arguments.get("repo_path", ".")
+    
+    # If no diff provided, try to get from Git
+    if not diff_content or diff_content.strip() == "":
+        git_handler = get_git_handler()
+        if not git_handler:
             return [TextContent(
                 type="text",
-                text=f"Unknown tool: {name}"
+                text="Error: Git handler not initialized. Cannot fetch Git diff."
             )]
+        diff_content = await _run_git(git_handler.get_uncommitted_changes)
+        if not diff_content or diff_content.strip() == "":
+            from src.config import get_config
+            diff_content = await _run_git(
+                git_handler.get_diff, get_config().git_branch
+            )
+    
+    if not diff_content or diff_content.strip() == "":
+        return [TextContent(
+            type="text",
+            text="No code changes found. Please make some changes to your code or provide a Git diff."
+        )]
+    
+    # Process code changes
+    update = await _process_code_changes_shared(orchestrator, diff_content, repo_path)
     
+    result = {
+        "documentation": update.content,
+        "file_path": update.file_path,
+        "evaluation_score": update.evaluation_score,
+        "ready_to_commit": update.ready_to_commit,
+        "code_snippets_count": len(update.code_snippets)
+    }
+    
+    return [TextContent(
+        type="text",
+        text=orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
+    )]
+
+
+async def _handle_get_git_diff(arguments: Any) -> Sequence[TextContent]:
+    """Return the uncommitted diff or the diff against a branch."""
+    git_handler = get_git_handler()
+    if not git_handler:
+        return [TextContent(
+            type="text",
+            text="Error: Git handler not initialized. Check server logs for details."
+        )]
+    
+    branch = arguments.get("branch", "main")
+    uncommitted_only = arguments.get("uncommitted_only", False)
+    
+    if uncommitted_only:
+        diff = await _run_git(git_handler.get_uncommitted_changes)
+    else:
+        diff = await _run_git(git_handler.get_diff, branch)
+    
+    if not diff or diff.strip() == "":
+        return [TextContent(
+            type="text",
+            text="No changes found."
+        )]
+    
+    return [TextContent(
+        type="text",
+        text=diff
+    )]
+
+
+async def _handle_update_documentation(arguments: Any) -> Sequence[TextContent]:
+    """Write and commit a documentation file."""
+    git_handler = get_git_handler()
+    if not git_handler:
+        return [TextContent(
+            type="text",
+            text="Error: Git handler not initialized. Check server logs for details."
+        )]
+    
+    file_path = arguments["file_path"]
+    content = arguments["content"]
+    commit_message = arguments.get("commit_message", "docs: Update documentation")
+    
+    success = await _run_git(
+        git_handler.commit_documentation, file_path, content, commit_message
+    )
+    
+    if success:
+        return [TextContent(
+            type="text",
+            text=f"Documentation updated successfully: {file_path}"
+        )]
+    else:
+        return [TextContent(
+            type="text",
+            text=f"Failed to update documentation: {file_path}"
+        )]
+
+
+async def _handle_commit_documentation(arguments: Any) -> Sequence[TextContent]:
+    """Write and commit a documentation file, echoing the commit message."""
+    git_handler = get_git_handler()
+    if not git_handler:
+        return [TextContent(
+            type="text",
+            text="Error: Git handler not initialized. Check server logs for details."
+        )]
+    
+    file_path = arguments["file_path"]
+    content = arguments["content"]
+    commit_message = arguments.get("commit_message", "docs: Update documentation")
+    
+    success = await _run_git(
+        git_handler.commit_documentation, file_path, content, commit_message
+    )
+    
+    if success:
+        return [TextContent(
+            type="text",
+            text=f"Documentation committed successfully: {file_path}\nCommit message: {commit_message}"
+        )]
+    else:
+        return [TextContent(
+            type="text",
+            text=f"Failed to commit documentation: {file_path}"
+        )]
+
+
+async def _handle_get_recent_commits(arguments: Any) -> Sequence[TextContent]:
+    """Return recent commits as JSON."""
+    git_handler = get_git_handler()
+    if not git_handler:
+        return [TextContent(
+            type="text",
+            text="Error: Git handler not initialized. Check server logs for details."
+        )]
+    
+    limit = arguments.get("limit", 10)
+    commits = await _run_git(git_handler.get_recent_commits, limit)
+    
+    if not commits:
+        return [TextContent(
+            type="text",
+            text="No commits found."
+        )]
+    
+    result = orjson.dumps(commits, option=orjson.OPT_INDENT_2).decode()
+    return [TextContent(
+        type="text",
+        text=result
+    )]
+
+
+# Tool name -> handler, looked up once per call instead of an if/elif chain
+_TOOL_HANDLERS: dict[str, Callable[[Any], Awaitable[Sequence[TextContent]]]] = {
+    "process_code_changes": _handle_process_code_changes,
+    "get_git_diff": _handle_get_git_diff,
+    "update_documentation": _handle_update_documentation,
+    "commit_documentation": _handle_commit_documentation,
+    "get_recent_commits": _handle_get_recent_commits,
+}
+
+
+@server.call_tool()
+async def call_tool(name: str, arguments: Any) -> Sequence[TextContent]:
+    """Handle tool calls."""
+    handler = _TOOL_HANDLERS.get(name)
+    if handler is None:
+        return [TextContent(
+            type="text",
+            text=f"Unknown tool: {name}"
+        )]
+    
+    try:
+        return await handler(arguments)
     except Exception as e:
         # Log error to stderr (not stdout)
-        import traceback
         sys.stderr.write(f"Error in tool '{name}': {e}\n")
         sys.stderr.write(traceback.format_exc())
         sys.stderr.flush()
@@ -323,7 +414,6 @@ async def main():
             )
     except Exception as e:
         # Log to stderr, not stdout
-        import traceback
         sys.stderr.write(f"Fatal error in MCP server: {e}\n")
         sys.stderr.write(traceback.format_exc())
         sys.stderr.flush()
@@ -331,8 +421,16 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Library errors (e.g. GitHandler) are logged; keep them on stderr
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
     try:
-        asyncio.run(main())
+        if uvloop is not None and hasattr(uvloop, "run"):
+            uvloop.run(main())
+        else:
+            # uvloop.run needs uvloop>=0.18; older releases install a policy
+            if uvloop is not None:
+                uvloop.install()
+            asyncio.run(main())
     except KeyboardInterrupt:
         # Normal shutdown
         sys.stderr.write("MCP server shutting down...\n")
@@ -0,0 +1,251 @@
+"""Persistent response cache for generated documentation."""
+import functools
+import hashlib
+import math
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from src.config import get_config
+
+
+class ResponseCache:
+    """SQLite-backed key/value cache with per-entry expiry."""
+
+    def __init__(self, cache_dir: str, ttl: int = 86400):
+        self.path = Path(cache_dir).expanduser() / "responses.sqlite3"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (key, unit vector, expires_at of the response it indexes)
+        self._vectors: Optional[List[Tuple[str, array, float]]] = None
+        self.stats = {"exact_hits": 0, "structure_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database on first use."""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._purge_expired(self._conn)
+        return self._conn
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        """Delete expired responses and any embeddings left without a response."""
+        now = time.time()
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM embeddings WHERE key NOT IN (SELECT key FROM responses)")
+        conn.commit()
+        if self._vectors is not None:
+            self._vectors[:] = [entry for entry in self._vectors if entry[2] >= now]
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss or expired entry."""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or row[1] < time.time():
+                return None
+            return pickle.loads(row[0])
+        except Exception as e:
+            sys.stderr.write(f"Error reading response cache: {e}\n")
+            sys.stderr.flush()
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store value under key until the configured TTL elapses."""
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            expires_at = time.time() + self.ttl
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, expires_at)
+                )
+                conn.commit()
+                self._purge_expired(conn)
+                if self._vectors is not None:
+                    # A refreshed entry keeps its embedding; track the new expiry
+                    self._vectors[:] = [
+                        (k, v, expires_at if k == key else e) for k, v, e in self._vectors
+                    ]
+        except Exception as e:
+            sys.stderr.write(f"Error writing response cache: {e}\n")
+            sys.stderr.flush()
+
+    def _load_vectors(self) -> List[Tuple[str, array, float]]:
+        """Load stored embeddings and their response expiry on first lookup."""
+        if self._vectors is None:
+            rows = self._connect().execute(
+                "SELECT e.key, e.vector, r.expires_at FROM embeddings e "
+                "JOIN responses r ON r.key = e.key"
+            ).fetchall()
+            self._vectors = []
+            for key, blob, expires_at in rows:
+                vector = array('f')
+                vector.frombytes(blob)
+                self._vectors.append((key, vector, expires_at))
+        return self._vectors
+
+    def find_similar(
+        self,
+        embedding: List[float],
+        threshold: float,
+        key_suffix: str = ""
+    ) -> Optional[Any]:
+        """Return the cached value whose embedding is most similar, if above threshold.
+
+        Only keys ending with key_suffix are considered, so lookups can be
+        scoped to a single repository.
+        """
+        query = _normalize(embedding)
+        if query is None:
+            return None
+        try:
+            with self._lock:
+                vectors = self._load_vectors()
+            now = time.time()
+            best_key, best_score = None, threshold
+            for key, vector, expires_at in vectors:
+                # Expired entries must not hide a live match further down
+                if expires_at < now or len(vector) != len(query) or not key.endswith(key_suffix):
+                    continue
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+        except Exception as e:
+            sys.stderr.write(f"Error searching response cache: {e}\n")
+            sys.stderr.flush()
+            return None
+        return self.get(best_key) if best_key is not None else None
+
+    def add_embedding(self, key: str, embedding: List[float]) -> None:
+        """Index an embedding for an already cached key."""
+        vector = _normalize(embedding)
+        if vector is None:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, vector.tobytes())
+                )
+                conn.commit()
+                vectors = self._load_vectors()
+                vectors[:] = [entry for entry in vectors if entry[0] != key]
+                vectors.append((key, vector, row[0]))
+        except Exception as e:
+            sys.stderr.write(f"Error writing response cache: {e}\n")
+            sys.stderr.flush()
+
+    def record(self, outcome: str) -> None:
+        """Count a cache outcome and log the running totals to stderr."""
+        self.stats[outcome] += 1
+        sys.stderr.write(
+            "Response cache {0}: exact_hits={exact_hits} structure_hits={structure_hits} "
+            "semantic_hits={semantic_hits} misses={misses}\n".format(outcome, **self.stats)
+        )
+        sys.stderr.flush()
+
+
+def _normalize(embedding: List[float]) -> Optional[array]:
+    """Scale an embedding to unit length so a dot product is cosine similarity."""
+    norm = math.sqrt(sum(x * x for x in embedding))
+    if not norm:
+        return None
+    return array('f', (x / norm for x in embedding))
+
+
+def diff_cache_key(diff_content: str, repo_path: str = ".") -> str:
+    """Build a cache key from a normalized diff and the repository path."""
+    # Skip the CRLF rewrite (a full copy) for the usual LF-only diff
+    if '\r' in diff_content:
+        diff_content = diff_content.replace('\r\n', '\n')
+    return hashlib.sha256(diff_content.strip().encode('utf-8')).hexdigest() + ":" + repo_path
+
+
+def changes_key_suffix(structured_changes: Dict[str, Any], repo_path: str = ".") -> str:
+    """Build the changes_cache_key suffix: the changed file set and repository.
+
+    Semantic lookups are scoped to this suffix, so a near-identical change set
+    only reuses an update written for exactly the same files.
+    """
+    paths = sorted({change.get('file_path', '') for change in structured_changes.get('changes') or []})
+    return ":" + hashlib.sha256(orjson.dumps(paths)).hexdigest()[:16] + ":" + repo_path
+
+
+def changes_cache_key(structured_changes: Dict[str, Any], repo_path: str = ".") -> str:
+    """Build a cache key from structured changes and the repository path.
+
+    The drafting prompt is built only from the structured changes, so equal
+    structures (e.g. diffs differing only in context lines or index hashes)
+    share a key.
+    """
+    canonical = orjson.dumps(structured_changes, option=orjson.OPT_SORT_KEYS)
+    return (
+        "changes:" + hashlib.sha256(canonical).hexdigest()
+        + changes_key_suffix(structured_changes, repo_path)
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache."""
+    config = get_config()
+    return ResponseCache(config.cache_dir, ttl=config.cache_ttl_seconds)
+
+
+def cached_llm_call(func):
+    """Memoize a ``(self, diff_content, repo_path)`` documentation call.
+
+    This is the first cache tier: an exact hash of the normalized diff,
+    checked before the diff is even parsed. The structured-change and
+    semantic tiers live in the orchestrator, where the structured changes
+    are available. Only updates that Gemini drafted and that passed the
+    quality gate are stored; fallback output (Gemini failed or has no API
+    key) can still pass the gate, so it is excluded explicitly.
+    """
+    @functools.wraps(func)
+    def wrapper(self, diff_content: str, repo_path: str = "."):
+        if not get_config().cache_enabled or not diff_content or not diff_content.strip():
+            return func(self, diff_content, repo_path)
+
+        cache = get_response_cache()
+        key = diff_cache_key(diff_content, repo_path)
+        cached = cache.get(key)
+        if cached is not None:
+            cache.record("exact_hits")
+            return cached
+
+        update = func(self, diff_content, repo_path)
+        if update.ready_to_commit and update.llm_drafted:
+            cache.set(key, update)
+        return update
+
+    return wrapper
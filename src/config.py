@@ -1,38 +1,65 @@
 """Configuration management for the Live Document Editor."""
+import functools
 import os
+from dataclasses import dataclass, field
 from typing import Optional
-from pydantic import BaseModel
 from dotenv import load_dotenv
 
-load_dotenv()
 
+def _env(name: str, default: Optional[str] = None):
+    """Read an environment variable when the config is built, not at import."""
+    return field(default_factory=lambda: os.getenv(name, default))
 
-class Config(BaseModel):
+
+@dataclass(frozen=True)
+class Config:
     """Application configuration."""
-    
+
     # Gemini Configuration
-    gemini_api_key: Optional[str] = os.getenv("GEMINI_API_KEY")
-    
+    gemini_api_key: Optional[str] = _env("GEMINI_API_KEY")
+
     # Daytona Configuration
-    daytona_api_key: Optional[str] = os.getenv("DAYTONA_API_KEY")
-    daytona_api_url: Optional[str] = os.getenv("DAYTONA_API_URL", "https://app.daytona.io/api")
-    
+    daytona_api_key: Optional[str] = _env("DAYTONA_API_KEY")
+    daytona_api_url: Optional[str] = _env("DAYTONA_API_URL", "https://app.daytona.io/api")
+    daytona_max_sandboxes: int = field(
+        default_factory=lambda: int(os.getenv("DAYTONA_MAX_SANDBOXES", "4"))
+    )
+
     # Galileo Configuration
-    galileo_api_key: Optional[str] = os.getenv("GALILEO_API_KEY")
-    galileo_project_id: Optional[str] = os.getenv("GALILEO_PROJECT_ID")
-    
+    galileo_api_key: Optional[str] = _env("GALILEO_API_KEY")
+    galileo_project_id: Optional[str] = _env("GALILEO_PROJECT_ID")
+
     # CodeRabbit Configuration
-    coderabbit_api_key: Optional[str] = os.getenv("CODERABBIT_API_KEY")
-    coderabbit_api_url: Optional[str] = os.getenv("CODERABBIT_API_URL", "https://api.coderabbit.ai")
-    
+    coderabbit_api_key: Optional[str] = _env("CODERABBIT_API_KEY")
+    coderabbit_api_url: Optional[str] = _env("CODERABBIT_API_URL", "https://api.coderabbit.ai")
+
     # Git Configuration
-    git_repo_path: Optional[str] = os.getenv("GIT_REPO_PATH", ".")
-    git_branch: str = os.getenv("GIT_BRANCH", "main")
-    
+    git_repo_path: Optional[str] = _env("GIT_REPO_PATH", ".")
+    git_branch: str = _env("GIT_BRANCH", "main")
+
     # Quality Thresholds
-    min_doc_quality_score: float = float(os.getenv("MIN_DOC_QUALITY_SCORE", "0.7"))
-    max_self_correction_attempts: int = int(os.getenv("MAX_SELF_CORRECTION_ATTEMPTS", "3"))
+    min_doc_quality_score: float = field(
+        default_factory=lambda: float(os.getenv("MIN_DOC_QUALITY_SCORE", "0.7"))
+    )
+    max_self_correction_attempts: int = field(
+        default_factory=lambda: int(os.getenv("MAX_SELF_CORRECTION_ATTEMPTS", "3"))
+    )
 
+    # Response Cache
+    cache_enabled: bool = field(
+        default_factory=lambda: os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    )
+    cache_dir: str = _env("CACHE_DIR", "~/.docusync/cache")
+    cache_ttl_seconds: int = field(
+        default_factory=lambda: int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+    )
+    semantic_cache_threshold: float = field(
+        default_factory=lambda: float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    )
 
-config = Config()
 
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Load .env and build the process-wide configuration on first use."""
+    load_dotenv()
+    return Config()
@@ -1,9 +1,24 @@
 """Git integration for monitoring changes and committing documentation."""
 import git
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from pathlib import Path
+import logging
 import os
-import sys
+
+# pygit2 (libgit2 bindings) is optional; without it every diff shells out to git
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Bound on memoized git results; the cache is simply reset when full
+_MAX_CACHED_RESULTS = 128
+
+# hash, author, committer date (strict ISO 8601), full message
+_LOG_FORMAT = '--format=%H%x1f%an%x1f%cI%x1f%B%x1e'
 
 
 class GitHandler:
@@ -12,6 +27,8 @@ class GitHandler:
     def __init__(self, repo_path: str = "."):
         self.repo_path = Path(repo_path).resolve()
         self.repo = None
+        self._pg_repo = None
+        self._results: Dict[tuple, Any] = {}
         self._initialize_repo()
     
     def _initialize_repo(self):
@@ -22,10 +39,28 @@ class GitHandler:
             # Try to initialize if not a git repo
             try:
                 self.repo = git.Repo.init(self.repo_path)
-            except Exception as e:
-                sys.stderr.write(f"Error initializing Git repository: {e}\n")
-                sys.stderr.flush()
+            except Exception:
+                logger.exception("Error initializing Git repository")
                 self.repo = None
+        
+        if self.repo and pygit2:
+            try:
+                self._pg_repo = pygit2.Repository(str(self.repo_path))
+            except Exception:
+                self._pg_repo = None
+    
+    def _resolve_sha(self, ref: str) -> Optional[str]:
+        """Resolve a ref to a commit SHA by reading refs directly (no subprocess)."""
+        try:
+            return self.repo.rev_parse(ref).hexsha
+        except Exception:
+            return None
+    
+    def _remember(self, key: tuple, value: Any) -> None:
+        """Store a result keyed by immutable commit SHAs."""
+        if len(self._results) >= _MAX_CACHED_RESULTS:
+            self._results.clear()
+        self._results[key] = value
     
     def get_diff(self, branch: str = "main", compare_branch: Optional[str] = None) -> str:
         """
@@ -43,17 +78,73 @@ class GitHandler:
         
         try:
             if compare_branch:
-                diff = self.repo.git.diff(compare_branch, branch)
+                # A diff between two commits never changes, so key it on their SHAs.
+                # The single-branch form compares against the working tree and
+                # is never cached.
+                key = ('diff', self._resolve_sha(compare_branch), self._resolve_sha(branch))
+                if None not in key and key in self._results:
+                    return self._results[key]
+                diff = self._tree_diff(compare_branch, branch)
+                if diff is None:
+                    diff = self.repo.git.diff(compare_branch, branch)
+                if None not in key:
+                    self._remember(key, diff)
             else:
                 # Compare with HEAD
                 diff = self.repo.git.diff(branch)
             
             return diff
-        except Exception as e:
-            sys.stderr.write(f"Error getting diff: {e}\n")
-            sys.stderr.flush()
+        except Exception:
+            logger.exception("Error getting diff")
             return ""
     
+    def _tree_diff(self, old_ref: str, new_ref: str) -> Optional[str]:
+        """Diff two commits in-process with libgit2; None if unavailable."""
+        if not self._pg_repo:
+            return None
+        
+        try:
+            old_tree = self._pg_repo.revparse_single(old_ref).peel(pygit2.Commit).tree
+            new_tree = self._pg_repo.revparse_single(new_ref).peel(pygit2.Commit).tree
+            # git diff applies the indent heuristic and detects renames by
+            # default; match its output
+            diff = self._pg_repo.diff(
+                old_tree, new_tree,
+                flags=pygit2.enums.DiffOption.INDENT_HEURISTIC
+            )
+            diff.find_similar()
+            patch = diff.patch or ""
+            # GitPython strips the final newline from git output
+            return patch[:-1] if patch.endswith('\n') else patch
+        except Exception:
+            return None
+    
+    def get_raw_diff(self, branch: str = "main", compare_branch: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get per-file change metadata without generating patch text.
+        
+        Runs a single `git diff --raw --numstat -z` with the same ref
+        semantics as get_diff.
+        
+        Args:
+            branch: Branch to compare from
+            compare_branch: Branch to compare to (default: working tree)
+            
+        Returns:
+            List of dicts with 'file_path', 'status', 'lines_added' and
+            'lines_removed' (binary files count as 0)
+        """
+        if not self.repo:
+            return []
+        
+        try:
+            refs = [compare_branch, branch] if compare_branch else [branch]
+            output = self.repo.git.diff('--raw', '--numstat', '-z', *refs)
+            return _parse_raw_numstat(output)
+        except Exception:
+            logger.exception("Error getting raw diff")
+            return []
+    
     def get_uncommitted_changes(self) -> str:
         """Get uncommitted changes."""
         if not self.repo:
@@ -61,11 +152,33 @@ class GitHandler:
         
         try:
             return self.repo.git.diff()
-        except Exception as e:
-            sys.stderr.write(f"Error getting uncommitted changes: {e}\n")
-            sys.stderr.flush()
+        except Exception:
+            logger.exception("Error getting uncommitted changes")
             return ""
     
+    def read_blob(self, ref: str) -> Optional[bytes]:
+        """
+        Read an object's contents, e.g. "HEAD:README.md" or a blob SHA.
+        
+        Uses GitPython's persistent `git cat-file --batch` process, so
+        repeated reads share one subprocess instead of forking per call.
+        
+        Args:
+            ref: Any object name accepted by git cat-file
+            
+        Returns:
+            Raw object contents, or None if the object cannot be read
+        """
+        if not self.repo:
+            return None
+        
+        try:
+            _, _, _, data = self.repo.git.get_object_data(ref)
+            return data
+        except Exception:
+            logger.exception("Error reading object %s", ref)
+            return None
+    
     def commit_documentation(
         self, 
         file_path: str, 
@@ -83,25 +196,45 @@ class GitHandler:
         Returns:
             True if successful
         """
-        if not self.repo:
+        return self.commit_documentation_batch([(file_path, content)], commit_message)
+    
+    def commit_documentation_batch(
+        self,
+        entries: List[Tuple[str, str]],
+        commit_message: str = "docs: Update documentation"
+    ) -> bool:
+        """
+        Write several documentation files and commit them together.
+        
+        All files are written first, then staged with one index update and
+        recorded in a single commit.
+        
+        Args:
+            entries: (file_path, content) pairs
+            commit_message: Commit message
+            
+        Returns:
+            True if successful
+        """
+        if not self.repo or not entries:
             return False
         
         try:
-            # Write file
-            full_path = self.repo_path / file_path
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            full_path.write_text(content, encoding='utf-8')
+            # Write files
+            for file_path, content in entries:
+                full_path = self.repo_path / file_path
+                full_path.parent.mkdir(parents=True, exist_ok=True)
+                full_path.write_text(content, encoding='utf-8')
             
-            # Stage file
-            self.repo.index.add([file_path])
+            # Stage files
+            self.repo.index.add([file_path for file_path, _ in entries])
             
             # Commit
             self.repo.index.commit(commit_message)
             
             return True
-        except Exception as e:
-            sys.stderr.write(f"Error committing documentation: {e}\n")
-            sys.stderr.flush()
+        except Exception:
+            logger.exception("Error committing documentation")
             return False
     
     def push_changes(self, branch: str = "main", remote: str = "origin") -> bool:
@@ -113,9 +246,8 @@ class GitHandler:
             origin = self.repo.remote(remote)
             origin.push(branch)
             return True
-        except Exception as e:
-            sys.stderr.write(f"Error pushing changes: {e}\n")
-            sys.stderr.flush()
+        except Exception:
+            logger.exception("Error pushing changes")
             return False
     
     def get_recent_commits(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -124,18 +256,28 @@ class GitHandler:
             return []
         
         try:
-            commits = []
-            for commit in self.repo.iter_commits(max_count=limit):
-                commits.append({
-                    'hash': commit.hexsha,
-                    'message': commit.message.strip(),
-                    'author': commit.author.name,
-                    'date': commit.committed_datetime.isoformat()
-                })
+            key = ('commits', self._resolve_sha('HEAD'), limit)
+            if key[1] is not None and key in self._results:
+                return self._results[key]
+            
+            # One git log call emitting exactly the needed fields; \x1f and \x1e
+            # never appear in commit metadata, so no escaping is required
+            output = self.repo.git.log(f'-n{limit}', _LOG_FORMAT)
+            records = [record.split('\x1f', 3) for record in output.split('\x1e')]
+            commits = [
+                {
+                    'hash': fields[0].lstrip('\n'),
+                    'message': fields[3].strip(),
+                    'author': fields[1],
+                    'date': fields[2]
+                }
+                for fields in records if len(fields) == 4
+            ]
+            if key[1] is not None:
+                self._remember(key, commits)
             return commits
-        except Exception as e:
-            sys.stderr.write(f"Error getting commits: {e}\n")
-            sys.stderr.flush()
+        except Exception:
+            logger.exception("Error getting commits")
             return []
     
     def watch_changes(self, callback, branch: str = "main"):
@@ -143,3 +285,36 @@ class GitHandler:
         # This is a placeholder - in production, use watchdog or Git hooks
         pass
 
+
+def _parse_raw_numstat(output: str) -> List[Dict[str, Any]]:
+    """Parse `git diff --raw --numstat -z` output into per-file entries."""
+    tokens = iter(output.split('\0'))
+    statuses = []
+    entries = []
+    
+    for token in tokens:
+        if not token:
+            continue
+        if token.startswith(':'):
+            # Raw record: ":<modes> <shas> <status>" then one path, or two
+            # for renames/copies
+            status = token.rsplit(' ', 1)[-1][:1]
+            path = next(tokens, '')
+            if status in ('R', 'C'):
+                path = next(tokens, '')
+            statuses.append(status)
+            continue
+        
+        # Numstat record: "<added>\t<removed>\t<path>", path empty on renames
+        added, removed, path = token.split('\t', 2)
+        if not path:
+            next(tokens, '')
+            path = next(tokens, '')
+        entries.append({
+            'file_path': path,
+            'status': statuses[len(entries)] if len(entries) < len(statuses) else 'M',
+            'lines_added': int(added) if added.isdigit() else 0,
+            'lines_removed': int(removed) if removed.isdigit() else 0
+        })
+    
+    return entries
@@ -1,16 +1,72 @@
 """CodeRabbit MCP Server - Structures and analyzes code changes."""
+import functools
+import itertools
 import json
+import re
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
 
+# One pass over the diff: file header, new-file path, old-file path (ignored),
+# added body line, removed body line. Context and hunk lines never match.
+# Anchoring on a literal newline lets the regex engine skip ahead with a fast
+# character search; the first line is matched separately.
+_DIFF_LINE_BODY = r'(?:(diff --git)|(\+\+\+[^\n]*)|---|\+([^\n]*)|-([^\n]*))'
+_DIFF_FIRST_LINE_RE = re.compile(r'\A' + _DIFF_LINE_BODY)
+_DIFF_LINE_RE = re.compile(r'\n' + _DIFF_LINE_BODY)
+_FILE_HEADER, _NEW_FILE, _ADDED, _REMOVED = 1, 2, 3, 4
+
+# Only this many added/removed lines per file are kept as snippets
+_SNIPPET_LINES = 10
+
+# git diff --raw status letter -> CodeChange.change_type
+_RAW_STATUS_TYPES = {'A': 'added', 'D': 'deleted'}
+
+_EXT_MAP = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.java': 'java',
+    '.cpp': 'cpp',
+    '.c': 'c',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.rb': 'ruby',
+    '.php': 'php',
+    '.md': 'markdown',
+    '.json': 'json',
+    '.yaml': 'yaml',
+    '.yml': 'yaml'
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _language_for_path(file_path: str) -> str:
+    """Map a file path to its language with one extension lookup."""
+    _, dot, ext = file_path.rpartition('.')
+    if not dot:
+        return 'unknown'
+    return _EXT_MAP.get('.' + ext, 'unknown')
+
+
 @dataclass
 class CodeChange:
-    """Represents a structured code change."""
+    """Represents a structured code change.
+    
+    Only the first _SNIPPET_LINES added/removed lines are retained; the
+    counts cover the whole file section.
+    """
+    __slots__ = (
+        'file_path', 'change_type', 'lines_added_snippet', 'lines_added_count',
+        'lines_removed_snippet', 'lines_removed_count', 'language', 'complexity', 'summary'
+    )
+    
     file_path: str
     change_type: str  # 'added', 'modified', 'deleted'
-    lines_added: List[str]
-    lines_removed: List[str]
+    lines_added_snippet: List[str]
+    lines_added_count: int
+    lines_removed_snippet: List[str]
+    lines_removed_count: int
     language: str
     complexity: str  # 'low', 'medium', 'high'
     summary: str
@@ -34,7 +90,33 @@ class CodeRabbitServer:
         Returns:
             Structured analysis of code changes
         """
-        changes = self._parse_diff(diff_content)
+        return self._structure(self._parse_diff(diff_content))
+    
+    def structure_from_raw(self, raw_entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Structure code changes from per-file metadata (GitHandler.get_raw_diff).
+        
+        Produces the same shape as structure_code_changes with empty code
+        snippets, without the patch text ever being generated or parsed.
+        
+        Args:
+            raw_entries: Dicts with 'file_path', 'status', 'lines_added'
+                and 'lines_removed'
+            
+        Returns:
+            Structured analysis of code changes
+        """
+        changes = []
+        for entry in raw_entries:
+            changes.append(self._build_change(
+                entry['file_path'],
+                _RAW_STATUS_TYPES.get(entry.get('status'), 'modified'),
+                [], entry['lines_added'], [], entry['lines_removed']
+            ))
+        return self._structure(changes)
+    
+    def _structure(self, changes: List[CodeChange]) -> Dict[str, Any]:
+        """Convert parsed changes into the structured-changes dict."""
         structured_changes = []
         
         for change in changes:
@@ -44,11 +126,11 @@ class CodeRabbitServer:
                 "language": change.language,
                 "complexity": change.complexity,
                 "summary": change.summary,
-                "lines_added": len(change.lines_added),
-                "lines_removed": len(change.lines_removed),
+                "lines_added": change.lines_added_count,
+                "lines_removed": change.lines_removed_count,
                 "code_snippets": {
-                    "added": change.lines_added[:10],  # First 10 lines
-                    "removed": change.lines_removed[:10]
+                    "added": change.lines_added_snippet,
+                    "removed": change.lines_removed_snippet
                 }
             }
             structured_changes.append(structured_change)
@@ -64,89 +146,89 @@ class CodeRabbitServer:
         changes = []
         current_file = None
         current_type = "modified"
-        added_lines = []
-        removed_lines = []
+        added_snippet = []
+        removed_snippet = []
+        added_count = removed_count = 0
         
-        for line in diff_content.split('\n'):
-            if line.startswith('diff --git'):
+        first = _DIFF_FIRST_LINE_RE.match(diff_content)
+        matches = _DIFF_LINE_RE.finditer(diff_content)
+        for match in itertools.chain((first,) if first else (), matches):
+            kind = match.lastindex
+            if kind == _ADDED:
+                if added_count < _SNIPPET_LINES:
+                    added_snippet.append(match.group(_ADDED))
+                added_count += 1
+            elif kind == _REMOVED:
+                if removed_count < _SNIPPET_LINES:
+                    removed_snippet.append(match.group(_REMOVED))
+                removed_count += 1
+            elif kind == _FILE_HEADER:
                 if current_file:
-                    changes.append(CodeChange(
-                        file_path=current_file,
-                        change_type=current_type,
-                        lines_added=added_lines,
-                        lines_removed=removed_lines,
-                        language=self._detect_language(current_file),
-                        complexity=self._assess_complexity(added_lines, removed_lines),
-                        summary=self._generate_summary(added_lines, removed_lines)
+                    changes.append(self._build_change(
+                        current_file, current_type,
+                        added_snippet, added_count, removed_snippet, removed_count
                     ))
-                added_lines = []
-                removed_lines = []
-            elif line.startswith('+++') or line.startswith('---'):
-                if line.startswith('+++'):
-                    current_file = line.replace('+++ b/', '').replace('+++ a/', '')
-            elif line.startswith('+') and not line.startswith('+++'):
-                added_lines.append(line[1:])
-            elif line.startswith('-') and not line.startswith('---'):
-                removed_lines.append(line[1:])
+                added_snippet = []
+                removed_snippet = []
+                added_count = removed_count = 0
+            elif kind == _NEW_FILE:
+                current_file = match.group(_NEW_FILE).replace('+++ b/', '').replace('+++ a/', '')
         
         # Add last file
         if current_file:
-            changes.append(CodeChange(
-                file_path=current_file,
-                change_type=current_type,
-                lines_added=added_lines,
-                lines_removed=removed_lines,
-                language=self._detect_language(current_file),
-                complexity=self._assess_complexity(added_lines, removed_lines),
-                summary=self._generate_summary(added_lines, removed_lines)
+            changes.append(self._build_change(
+                current_file, current_type,
+                added_snippet, added_count, removed_snippet, removed_count
             ))
         
         return changes
     
-    def _detect_language(self, file_path: str) -> str:
-        """Detect programming language from file extension."""
-        ext_map = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.ts': 'typescript',
-            '.java': 'java',
-            '.cpp': 'cpp',
-            '.c': 'c',
-            '.go': 'go',
-            '.rs': 'rust',
-            '.rb': 'ruby',
-            '.php': 'php',
-            '.md': 'markdown',
-            '.json': 'json',
-            '.yaml': 'yaml',
-            '.yml': 'yaml'
-        }
-        for ext, lang in ext_map.items():
-            if file_path.endswith(ext):
-                return lang
-        return 'unknown'
-    
-    def _assess_complexity(self, added: List[str], removed: List[str]) -> str:
-        """Assess code complexity based on changes."""
-        total_lines = len(added) + len(removed)
+    def _build_change(
+        self,
+        file_path: str,
+        change_type: str,
+        added_snippet: List[str],
+        added_count: int,
+        removed_snippet: List[str],
+        removed_count: int
+    ) -> CodeChange:
+        """Build a CodeChange for one file section of the diff."""
+        # Complexity is bucketed by total changed lines
+        total_lines = added_count + removed_count
         if total_lines < 10:
-            return 'low'
+            complexity = 'low'
         elif total_lines < 50:
-            return 'medium'
+            complexity = 'medium'
         else:
-            return 'high'
+            complexity = 'high'
+        
+        return CodeChange(
+            file_path=file_path,
+            change_type=change_type,
+            lines_added_snippet=added_snippet,
+            lines_added_count=added_count,
+            lines_removed_snippet=removed_snippet,
+            lines_removed_count=removed_count,
+            language=self._detect_language(file_path),
+            complexity=complexity,
+            summary=self._generate_summary(added_count, removed_count)
+        )
+    
+    def _detect_language(self, file_path: str) -> str:
+        """Detect programming language from file extension."""
+        return _language_for_path(file_path)
     
-    def _generate_summary(self, added: List[str], removed: List[str]) -> str:
-        """Generate a summary of the code changes."""
+    def _generate_summary(self, added: int, removed: int) -> str:
+        """Generate a summary from changed line counts."""
         if not added and not removed:
             return "No changes detected"
         
         if not removed:
-            return f"Added {len(added)} lines"
+            return f"Added {added} lines"
         if not added:
-            return f"Removed {len(removed)} lines"
+            return f"Removed {removed} lines"
         
-        return f"Modified: {len(added)} lines added, {len(removed)} lines removed"
+        return f"Modified: {added} lines added, {removed} lines removed"
     
     def _analyze_changes(self, changes: List[CodeChange]) -> Dict[str, Any]:
         """Analyze code changes and provide overall summary."""
@@ -159,19 +241,22 @@ class CodeRabbitServer:
                 "complexity_summary": {}
             }
         
-        total_added = sum(len(change.lines_added) for change in changes)
-        total_removed = sum(len(change.lines_removed) for change in changes)
-        languages = list(set(change.language for change in changes))
+        total_added = total_removed = 0
+        languages = set()
         complexity_counts = {}
         
+        # Single pass over the changes for every aggregate
         for change in changes:
+            total_added += change.lines_added_count
+            total_removed += change.lines_removed_count
+            languages.add(change.language)
             complexity_counts[change.complexity] = complexity_counts.get(change.complexity, 0) + 1
         
         return {
             "total_files": len(changes),
             "total_lines_added": total_added,
             "total_lines_removed": total_removed,
-            "languages": languages,
+            "languages": sorted(languages),
             "complexity_summary": complexity_counts
         }
 
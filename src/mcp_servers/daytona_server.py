@@ -1,9 +1,13 @@
 """Daytona MCP Server - Executes code snippets and handles success/failure."""
 from typing import Dict, Any, Optional, List
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
 from daytona import Daytona, DaytonaConfig
+import asyncio
 import os
+import queue
 import sys
+import threading
 
 
 @dataclass
@@ -16,14 +20,64 @@ class ExecutionResult:
     execution_time: Optional[float] = None
 
 
+@dataclass
+class ExecResult:
+    """A code snippet together with the outcome of executing it."""
+    __slots__ = ('id', 'code', 'language', 'success', 'exit_code', 'output', 'error')
+    
+    id: str
+    code: str
+    language: str
+    success: bool
+    exit_code: int
+    output: str
+    error: Optional[str]
+
+
+@dataclass
+class SnippetBatch:
+    """Code snippets stored as parallel lists; index i describes one snippet."""
+    ids: List[str] = field(default_factory=list)
+    codes: List[str] = field(default_factory=list)
+    languages: List[str] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def append(self, snippet_id: str, code: str, language: str, source: str = ""):
+        """Add one snippet to the batch."""
+        self.ids.append(snippet_id)
+        self.codes.append(code)
+        self.languages.append(language)
+        self.sources.append(source)
+    
+    def extend(self, other: "SnippetBatch"):
+        """Add every snippet of another batch."""
+        self.ids.extend(other.ids)
+        self.codes.extend(other.codes)
+        self.languages.extend(other.languages)
+        self.sources.extend(other.sources)
+
+
 class DaytonaServer:
     """MCP Server for Daytona - executes code and handles success/failure."""
     
-    def __init__(self, api_key: Optional[str] = None, api_url: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_url: Optional[str] = None,
+        max_sandboxes: int = 4
+    ):
         self.api_key = api_key or os.getenv("DAYTONA_API_KEY")
         self.api_url = api_url
         self.daytona = None
-        self.sandbox = None
+        self.max_sandboxes = max(1, max_sandboxes)
+        # Idle sandboxes; the pool grows on demand up to max_sandboxes
+        self._idle_sandboxes: queue.Queue = queue.Queue()
+        self._sandboxes: List[Any] = []
+        self._pool_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
         self._initialize()
     
     def _initialize(self):
@@ -35,16 +89,60 @@ class DaytonaServer:
             self.daytona = Daytona(config)
     
     def create_sandbox(self, language: str = "python") -> bool:
-        """Create a new sandbox for code execution."""
+        """Create a new sandbox and add it to the idle pool."""
+        sandbox = self._new_sandbox()
+        if sandbox is None:
+            return False
+        self._idle_sandboxes.put(sandbox)
+        return True
+    
+    def _new_sandbox(self) -> Optional[Any]:
+        """Create a sandbox if the pool has room; None on failure or when full."""
+        with self._pool_lock:
+            if not self.daytona or len(self._sandboxes) >= self.max_sandboxes:
+                return None
+            # Reserve the slot so concurrent callers cannot overshoot the limit
+            self._sandboxes.append(None)
+        
         try:
-            if not self.daytona:
-                return False
-            self.sandbox = self.daytona.create()
-            return True
+            sandbox = self.daytona.create()
         except Exception as e:
             sys.stderr.write(f"Error creating sandbox: {e}\n")
             sys.stderr.flush()
-            return False
+            sandbox = None
+        
+        with self._pool_lock:
+            self._sandboxes.remove(None)
+            if sandbox is not None:
+                self._sandboxes.append(sandbox)
+        return sandbox
+    
+    def _acquire_sandbox(self) -> Optional[Any]:
+        """Take an idle sandbox, creating one or waiting if the pool is full."""
+        while True:
+            try:
+                return self._idle_sandboxes.get_nowait()
+            except queue.Empty:
+                pass
+            
+            sandbox = self._new_sandbox()
+            if sandbox is not None:
+                return sandbox
+            
+            with self._pool_lock:
+                if not self._sandboxes:
+                    return None
+            
+            # Pool is full (or a creation failed); wait for a sandbox to free
+            # up, re-checking periodically in case in-flight creations fail
+            try:
+                return self._idle_sandboxes.get(timeout=1.0)
+            except queue.Empty:
+                continue
+    
+    def _release_sandbox(self, sandbox: Any):
+        """Return a sandbox to the idle pool."""
+        self._idle_sandboxes.put(sandbox)
     
     def execute_code(self, code: str, language: str = "python") -> ExecutionResult:
         """
@@ -57,21 +155,21 @@ class DaytonaServer:
         Returns:
             ExecutionResult with success status and output
         """
-        if not self.sandbox:
-            if not self.create_sandbox(language):
-                return ExecutionResult(
-                    success=False,
-                    exit_code=-1,
-                    output="",
-                    error="Failed to create sandbox"
-                )
+        sandbox = self._acquire_sandbox()
+        if sandbox is None:
+            return ExecutionResult(
+                success=False,
+                exit_code=-1,
+                output="",
+                error="Failed to create sandbox"
+            )
         
         try:
             if language == "python":
-                response = self.sandbox.process.code_run(code)
+                response = sandbox.process.code_run(code)
             else:
                 # For other languages, use exec
-                response = self.sandbox.process.exec(code)
+                response = sandbox.process.exec(code)
             
             return ExecutionResult(
                 success=response.exit_code == 0,
@@ -86,10 +184,12 @@ class DaytonaServer:
                 output="",
                 error=str(e)
             )
+        finally:
+            self._release_sandbox(sandbox)
     
     def execute_code_snippets(self, code_snippets: List[Dict[str, str]]) -> Dict[str, ExecutionResult]:
         """
-        Execute multiple code snippets.
+        Execute multiple code snippets concurrently across the sandbox pool.
         
         Args:
             code_snippets: List of dicts with 'code' and 'language' keys
@@ -97,24 +197,68 @@ class DaytonaServer:
         Returns:
             Dictionary mapping snippet IDs to execution results
         """
-        results = {}
-        
+        batch = SnippetBatch()
         for i, snippet in enumerate(code_snippets):
-            code = snippet.get('code', '')
-            language = snippet.get('language', 'python')
-            snippet_id = snippet.get('id', f'snippet_{i}')
+            batch.append(
+                snippet.get('id', f'snippet_{i}'),
+                snippet.get('code', ''),
+                snippet.get('language', 'python')
+            )
+        return dict(zip(batch.ids, self.execute_batch(batch)))
+    
+    def execute_batch(self, batch: SnippetBatch) -> List[ExecutionResult]:
+        """
+        Execute a batch of snippets concurrently across the sandbox pool.
+        
+        Args:
+            batch: Snippets to execute
             
-            result = self.execute_code(code, language)
-            results[snippet_id] = result
+        Returns:
+            Execution results in the same order as the batch
+        """
+        pairs = zip(batch.codes, batch.languages)
+        if len(batch) <= 1 or self.max_sandboxes == 1:
+            return [self.execute_code(code, language) for code, language in pairs]
         
-        return results
+        executor = self._get_executor()
+        futures = [executor.submit(self.execute_code, code, language) for code, language in pairs]
+        return [future.result() for future in futures]
+    
+    def submit_code(self, code: str, language: str = "python") -> Future:
+        """Start executing a snippet on the worker pool and return its future."""
+        return self._get_executor().submit(self.execute_code, code, language)
+    
+    async def aexecute_code_snippets(
+        self,
+        code_snippets: List[Dict[str, str]]
+    ) -> Dict[str, ExecutionResult]:
+        """Execute code snippets without blocking the event loop."""
+        return await asyncio.to_thread(self.execute_code_snippets, code_snippets)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the worker pool on first concurrent use."""
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_sandboxes,
+                    thread_name_prefix="daytona"
+                )
+            return self._executor
     
     def cleanup(self):
         """Clean up sandbox resources."""
-        if self.sandbox:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        
+        with self._pool_lock:
+            sandboxes = [sandbox for sandbox in self._sandboxes if sandbox is not None]
+            self._sandboxes = []
+        self._idle_sandboxes = queue.Queue()
+        
+        for sandbox in sandboxes:
             try:
-                self.sandbox.delete()
-                self.sandbox = None
+                sandbox.delete()
             except Exception as e:
                 sys.stderr.write(f"Error cleaning up sandbox: {e}\n")
                 sys.stderr.flush()
@@ -1,9 +1,15 @@
 """Galileo MCP Server - Evaluates documentation quality."""
-from typing import Dict, Any, Optional, List
+from typing import Any, Optional, List
 from dataclasses import dataclass
+import asyncio
 import json
 
 
+# Tone markers; each counts once if it appears anywhere in the document
+_PROFESSIONAL_WORDS = ('function', 'method', 'parameter', 'returns', 'example')
+_UNPROFESSIONAL_WORDS = ('gonna', 'wanna', 'kinda', 'yeah')
+
+
 @dataclass
 class EvaluationResult:
     """Result of documentation evaluation."""
@@ -26,7 +32,7 @@ class GalileoServer:
         self, 
         documentation: str, 
         code_context: Optional[str] = None,
-        code_snippets: Optional[List[Dict[str, Any]]] = None
+        code_snippets: Optional[List[Any]] = None
     ) -> EvaluationResult:
         """
         Evaluate documentation quality.
@@ -34,7 +40,7 @@ class GalileoServer:
         Args:
             documentation: Documentation text to evaluate
             code_context: Related code context
-            code_snippets: List of code snippets with execution results
+            code_snippets: Executed snippets (objects with a 'success' attribute)
             
         Returns:
             EvaluationResult with scores and feedback
@@ -42,9 +48,12 @@ class GalileoServer:
         # Basic evaluation logic
         # In production, this would call Galileo.ai API
         
-        accuracy_score = self._evaluate_accuracy(documentation, code_context, code_snippets)
-        tone_score = self._evaluate_tone(documentation)
-        clarity_score = self._evaluate_clarity(documentation)
+        # Lowercase and look for code fences once, shared across the evaluators
+        doc_lower = documentation.lower()
+        has_fence = '```' in documentation
+        accuracy_score = self._evaluate_accuracy(doc_lower, has_fence, code_context, code_snippets)
+        tone_score = self._evaluate_tone(doc_lower)
+        clarity_score = self._evaluate_clarity(documentation, doc_lower, has_fence)
         overall_score = (accuracy_score + tone_score + clarity_score) / 3.0
         
         feedback = []
@@ -73,9 +82,10 @@ class GalileoServer:
     
     def _evaluate_accuracy(
         self, 
-        documentation: str, 
+        doc_lower: str,
+        has_fence: bool,
         code_context: Optional[str],
-        code_snippets: Optional[List[Dict[str, Any]]]
+        code_snippets: Optional[List[Any]]
     ) -> float:
         """Evaluate documentation accuracy."""
         score = 0.8  # Base score
@@ -83,51 +93,47 @@ class GalileoServer:
         # Check if code snippets match execution results
         if code_snippets:
             for snippet in code_snippets:
-                exec_result = snippet.get('execution_result')
-                if exec_result and exec_result.get('success'):
+                if snippet.success:
                     score += 0.05
-                elif exec_result and not exec_result.get('success'):
+                else:
                     score -= 0.1
         
         # Check for code examples in documentation
-        if '```' in documentation or 'code' in documentation.lower():
+        if has_fence or 'code' in doc_lower:
             score += 0.05
         
         return min(1.0, max(0.0, score))
     
-    def _evaluate_tone(self, documentation: str) -> float:
-        """Evaluate documentation tone."""
+    def _evaluate_tone(self, doc_lower: str) -> float:
+        """Evaluate documentation tone from the lowercased text."""
         score = 0.7  # Base score
         
         # Check for professional language
-        professional_words = ['function', 'method', 'parameter', 'returns', 'example']
-        unprofessional_words = ['gonna', 'wanna', 'kinda', 'yeah']
-        
-        doc_lower = documentation.lower()
-        for word in professional_words:
+        for word in _PROFESSIONAL_WORDS:
             if word in doc_lower:
                 score += 0.02
         
-        for word in unprofessional_words:
+        for word in _UNPROFESSIONAL_WORDS:
             if word in doc_lower:
                 score -= 0.05
         
         return min(1.0, max(0.0, score))
     
-    def _evaluate_clarity(self, documentation: str) -> float:
+    def _evaluate_clarity(self, documentation: str, doc_lower: str, has_fence: bool) -> float:
         """Evaluate documentation clarity."""
         score = 0.7  # Base score
         
-        # Check for structure
-        if '# ' in documentation or '## ' in documentation:
+        # Check for structure ('## ' headings contain '# ' too)
+        if '# ' in documentation:
             score += 0.1  # Has headings
         
         # Check for examples
-        if 'example' in documentation.lower() or '```' in documentation:
+        if has_fence or 'example' in doc_lower:
             score += 0.1
         
-        # Check length (not too short, not too long)
-        word_count = len(documentation.split())
+        # Check length (not too short, not too long). Counting separators
+        # approximates the word count without building a list of words
+        word_count = documentation.count(' ') + documentation.count('\n') + 1
         if 50 <= word_count <= 1000:
             score += 0.05
         
@@ -136,4 +142,10 @@ class GalileoServer:
     def batch_evaluate(self, documentation_list: List[str]) -> List[EvaluationResult]:
         """Evaluate multiple documentation pieces."""
         return [self.evaluate_documentation(doc) for doc in documentation_list]
+    
+    async def abatch_evaluate(self, documentation_list: List[str]) -> List[EvaluationResult]:
+        """Evaluate multiple documentation pieces without blocking the event loop."""
+        # Scoring is CPU-bound Python today, so one worker thread for the
+        # whole batch beats fanning out across threads that share the GIL
+        return await asyncio.to_thread(self.batch_evaluate, documentation_list)
 
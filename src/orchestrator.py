@@ -1,14 +1,59 @@
 """MCP Client Orchestrator - Coordinates all MCP servers using Gemini."""
 import google.generativeai as genai
-from typing import Dict, Any, Optional, List
-import json
+import functools
+from typing import Callable, Dict, Any, Iterator, Optional, List, Tuple
+import io
+import re
 import sys
-from dataclasses import dataclass
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+
+import orjson
 
 from src.mcp_servers.coderabbit import CodeRabbitServer
-from src.mcp_servers.daytona_server import DaytonaServer
+from src.mcp_servers.daytona_server import DaytonaServer, ExecResult, SnippetBatch
 from src.mcp_servers.galileo_server import GalileoServer
-from src.config import config
+from src.cache import cached_llm_call, changes_cache_key, changes_key_suffix, get_response_cache
+from src.config import get_config
+
+
+# An added or removed diff line with non-whitespace content; '+++ '/'--- '
+# file headers are excluded
+_CHANGED_LINE_RE = re.compile(r'^(?:\+(?!\+\+ )|-(?!-- ))[ \t]*\S', re.M)
+
+# Added lines per change included in the prompt; matches the fallback document
+_PROMPT_SNIPPET_LINES = 5
+
+# Fixed instructions around the serialized changes in the drafting prompt.
+# The static text leads so every request shares the same prompt prefix.
+_DOC_PROMPT_PREFIX = """You are a technical documentation expert. Generate clear, accurate documentation for the following code changes:
+
+"""
+_DOC_PROMPT_SUFFIX = """
+
+Requirements:
+1. Write clear, professional documentation
+2. Include code examples where relevant
+3. Explain what changed and why
+4. Use proper markdown formatting
+5. Include code snippets in markdown code blocks
+
+Generate the documentation:"""
+
+# Prompt asking Gemini to revise a draft that scored below the quality bar
+_CORRECTION_TEMPLATE = """The following documentation was evaluated and received a score of {score:.2f}.
+
+Issues identified:
+{issues}
+
+Feedback:
+{feedback}
+
+Original documentation:
+{documentation}
+
+Please revise the documentation to address these issues. Generate improved documentation:"""
 
 
 @dataclass
@@ -16,35 +61,74 @@ class DocumentationUpdate:
     """Represents a documentation update."""
     file_path: str
     content: str
-    code_snippets: List[Dict[str, Any]]
+    code_snippets: List[ExecResult]
     evaluation_score: float
     ready_to_commit: bool
+    # True only when Gemini wrote the content; fallback text is never cached
+    llm_drafted: bool = False
 
 
 class MCPOrchestrator:
     """MCP Client Orchestrator using Gemini as the brain."""
     
     def __init__(self):
-        self.gemini_client = None
-        self.coderabbit = CodeRabbitServer(
-            api_key=config.coderabbit_api_key,
-            api_url=config.coderabbit_api_url
-        )
-        self.daytona = DaytonaServer(
-            api_key=config.daytona_api_key,
-            api_url=config.daytona_api_url
+        self.config = get_config()
+        self._daytona: Optional[DaytonaServer] = None
+        self._daytona_lock = threading.Lock()
+    
+    # Servers and the Gemini client are built on first use, so code paths
+    # that never touch one (or only call cleanup) do not pay for it
+    @functools.cached_property
+    def coderabbit(self) -> CodeRabbitServer:
+        return CodeRabbitServer(
+            api_key=self.config.coderabbit_api_key,
+            api_url=self.config.coderabbit_api_url
         )
-        self.galileo = GalileoServer(
-            api_key=config.galileo_api_key,
-            project_id=config.galileo_project_id
+    
+    @property
+    def daytona(self) -> DaytonaServer:
+        # cached_property no longer locks (3.12+); concurrent first calls
+        # must not build two servers and orphan the sandboxes of one
+        with self._daytona_lock:
+            if self._daytona is None:
+                self._daytona = DaytonaServer(
+                    api_key=self.config.daytona_api_key,
+                    api_url=self.config.daytona_api_url,
+                    max_sandboxes=self.config.daytona_max_sandboxes
+                )
+            return self._daytona
+    
+    @functools.cached_property
+    def galileo(self) -> GalileoServer:
+        return GalileoServer(
+            api_key=self.config.galileo_api_key,
+            project_id=self.config.galileo_project_id
         )
-        self._initialize_gemini()
     
-    def _initialize_gemini(self):
-        """Initialize Gemini client."""
-        if config.gemini_api_key:
-            genai.configure(api_key=config.gemini_api_key)
-            self.gemini_client = genai.GenerativeModel('gemini-pro')
+    @functools.cached_property
+    def gemini_client(self) -> Optional[Any]:
+        """Gemini model, or None when no API key is configured."""
+        if not self.config.gemini_api_key:
+            return None
+        genai.configure(api_key=self.config.gemini_api_key)
+        return genai.GenerativeModel('gemini-pro')
+    
+    def embed_text(self, text: str) -> Optional[List[float]]:
+        """Embed text with Gemini for similarity lookups; None if unavailable."""
+        if not self.gemini_client:
+            return None
+        
+        try:
+            result = genai.embed_content(
+                model='models/embedding-001',
+                content=text[:8000],
+                task_type='semantic_similarity'
+            )
+            return result['embedding']
+        except Exception as e:
+            sys.stderr.write(f"Error embedding text with Gemini: {e}\n")
+            sys.stderr.flush()
+            return None
     
     def process_code_changes(self, diff_content: str, repo_path: str = ".") -> DocumentationUpdate:
         """
@@ -61,211 +145,302 @@ class MCPOrchestrator:
         if not diff_content or not diff_content.strip():
             raise ValueError("Diff content is empty")
         
+        # A diff that adds or removes no non-blank line has nothing to document;
+        # skip parsing, the response cache (and its embedding call) and Gemini
+        if not _CHANGED_LINE_RE.search(diff_content):
+            return _empty_update()
+        
+        return self._document_changes(diff_content, repo_path)
+    
+    @cached_llm_call
+    def _document_changes(self, diff_content: str, repo_path: str = ".") -> DocumentationUpdate:
+        """Run the documentation pipeline for a diff with content changes."""
         # Step 1: Structure code changes using CodeRabbit
         structured_changes = self.coderabbit.structure_code_changes(diff_content, repo_path)
         
         # Check if we have any changes
-        if not structured_changes.get('changes') or len(structured_changes.get('changes', [])) == 0:
-            # Return a basic documentation update for empty changes
-            return DocumentationUpdate(
-                file_path="DOCUMENTATION.md",
-                content="# Documentation\n\nNo code changes detected to document.",
-                code_snippets=[],
-                evaluation_score=0.5,
-                ready_to_commit=False
-            )
+        changes = structured_changes.get('changes') or []
+        if not changes:
+            return _empty_update()
+        
+        # Serialized once; shared by the drafting prompt and every evaluation
+        changes_json = _canonical_changes_json(structured_changes)
         
-        # Step 2: Use Gemini to draft documentation
-        documentation = self._draft_documentation(structured_changes)
+        # Identical structured changes produce an identical prompt, so a stored
+        # update can be served without calling Gemini or Galileo again. Failing
+        # that, a near-identical change set (e.g. after a rebase) to the same
+        # files reuses its update
+        changes_key = None
+        embedding = None
+        if self.config.cache_enabled:
+            cache = get_response_cache()
+            changes_key = changes_cache_key(structured_changes, repo_path)
+            cached = cache.get(changes_key)
+            if cached is not None:
+                cache.record("structure_hits")
+                return cached
+            
+            embedding = self.embed_text(changes_json)
+            if embedding:
+                cached = cache.find_similar(
+                    embedding,
+                    self.config.semantic_cache_threshold,
+                    key_suffix=changes_key_suffix(structured_changes, repo_path)
+                )
+                if cached is not None:
+                    cache.record("semantic_hits")
+                    # The match touched the same files but may list them in
+                    # another order, which picks a different doc path
+                    return replace(cached, file_path=self._determine_doc_path(changes))
+            cache.record("misses")
+        
+        # Snippets taken straight from the changes do not depend on the draft,
+        # so they start running in Daytona before Gemini is even called
+        started: Dict[Tuple[str, str], Future] = {}
+        
+        def start(code: str, language: str):
+            if (code, language) not in started:
+                started[(code, language)] = self.daytona.submit_code(code, language)
+        
+        change_snippets = self._snippets_from_changes(changes)
+        for key in zip(change_snippets.codes, change_snippets.languages):
+            start(*key)
+        
+        # Step 2: Use Gemini to draft documentation. Code blocks start running
+        # in Daytona as soon as they are generated
+        documentation, llm_drafted = self._draft_documentation(
+            changes,
+            changes_json,
+            on_code_block=lambda lang, code: start(*_block_code_and_language(lang, code))
+        )
         
         # Step 3: Extract code snippets and execute them
-        code_snippets = self._extract_code_snippets(documentation, structured_changes)
-        execution_results = self._execute_code_snippets(code_snippets)
+        code_snippets = self._extract_code_snippets(documentation, change_snippets)
+        execution_results = self._execute_code_snippets(code_snippets, started)
         
         # Step 4: Evaluate documentation using Galileo
         evaluation = self.galileo.evaluate_documentation(
             documentation,
-            code_context=json.dumps(structured_changes),
+            code_context=changes_json,
             code_snippets=execution_results
         )
         
         # Step 5: Self-correction if needed
-        if evaluation.overall_score < config.min_doc_quality_score:
+        if evaluation.overall_score < self.config.min_doc_quality_score:
             documentation, evaluation = self._self_correct(
                 documentation,
-                structured_changes,
+                changes_json,
                 evaluation,
                 execution_results
             )
         
-        return DocumentationUpdate(
-            file_path=self._determine_doc_path(structured_changes),
+        update = DocumentationUpdate(
+            file_path=self._determine_doc_path(changes),
             content=documentation,
             code_snippets=execution_results,
             evaluation_score=evaluation.overall_score,
-            ready_to_commit=evaluation.overall_score >= config.min_doc_quality_score
+            ready_to_commit=evaluation.overall_score >= self.config.min_doc_quality_score,
+            llm_drafted=llm_drafted
         )
+        if changes_key and update.ready_to_commit and update.llm_drafted:
+            cache.set(changes_key, update)
+            if embedding:
+                cache.add_embedding(changes_key, embedding)
+        return update
     
-    def _draft_documentation(self, structured_changes: Dict[str, Any]) -> str:
-        """Use Gemini to draft documentation."""
-        prompt = self._create_documentation_prompt(structured_changes)
+    def _draft_documentation(
+        self,
+        changes: List[Dict[str, Any]],
+        changes_json: str,
+        on_code_block: Optional[Callable[[str, str], None]] = None
+    ) -> Tuple[str, bool]:
+        """
+        Use Gemini to draft documentation.
+        
+        The response is streamed; on_code_block, if given, is called with the
+        language tag and body of each fenced code block as soon as it closes.
+        Returns the documentation and whether Gemini produced it (False when
+        the fallback document was used instead).
+        """
+        prompt = self._create_documentation_prompt(changes_json)
         
         if self.gemini_client:
             try:
-                response = self.gemini_client.generate_content(prompt)
-                return response.text
+                documentation = ""
+                scanned = 0
+                for chunk in self.gemini_client.generate_content(prompt, stream=True):
+                    documentation += chunk.text
+                    if on_code_block is None:
+                        continue
+                    # A block closed in the text so far is final, so this yields
+                    # the same blocks, in order, as a scan of the full response
+                    for lang, code, scanned in _iter_code_blocks(documentation, scanned):
+                        on_code_block(lang, code)
+                return documentation, True
             except Exception as e:
                 sys.stderr.write(f"Error generating documentation with Gemini: {e}\n")
                 sys.stderr.flush()
-                return self._fallback_documentation(structured_changes)
+                return self._fallback_documentation(changes), False
         else:
-            return self._fallback_documentation(structured_changes)
+            return self._fallback_documentation(changes), False
     
-    def _create_documentation_prompt(self, structured_changes: Dict[str, Any]) -> str:
-        """Create prompt for Gemini to generate documentation."""
-        changes_summary = json.dumps(structured_changes, indent=2)
-        
-        prompt = f"""You are a technical documentation expert. Generate clear, accurate documentation for the following code changes:
-
-{changes_summary}
-
-Requirements:
-1. Write clear, professional documentation
-2. Include code examples where relevant
-3. Explain what changed and why
-4. Use proper markdown formatting
-5. Include code snippets in markdown code blocks
-
-Generate the documentation:"""
-        
-        return prompt
+    def _create_documentation_prompt(self, changes_json: str) -> str:
+        """Create prompt for Gemini from the serialized structured changes."""
+        return _DOC_PROMPT_PREFIX + changes_json + _DOC_PROMPT_SUFFIX
     
-    def _fallback_documentation(self, structured_changes: Dict[str, Any]) -> str:
+    def _fallback_documentation(self, changes: List[Dict[str, Any]]) -> str:
         """Fallback documentation generation if Gemini is unavailable."""
-        doc_lines = ["# Documentation Update\n"]
+        buf = io.StringIO()
+        write = buf.write
+        write("# Documentation Update\n")
         
-        for change in structured_changes.get('changes', []):
-            doc_lines.append(f"## {change['file_path']}\n")
-            doc_lines.append(f"**Change Type:** {change['change_type']}\n")
-            doc_lines.append(f"**Summary:** {change.get('summary', 'N/A')}\n")
-            doc_lines.append(f"**Language:** {change.get('language', 'unknown')}\n")
+        # Each section starts with the newline that used to join it to the last
+        for change in changes:
+            write(
+                f"\n## {change['file_path']}\n"
+                f"\n**Change Type:** {change['change_type']}\n"
+                f"\n**Summary:** {change.get('summary', 'N/A')}\n"
+                f"\n**Language:** {change.get('language', 'unknown')}\n"
+            )
             
-            if change.get('code_snippets', {}).get('added'):
-                doc_lines.append("\n### Added Code\n```")
-                doc_lines.append("\n".join(change['code_snippets']['added'][:5]))
-                doc_lines.append("```\n")
+            added = change.get('code_snippets', {}).get('added')
+            if added:
+                write("\n\n### Added Code\n```\n")
+                write("\n".join(added[:5]))
+                write("\n```\n")
         
-        return "\n".join(doc_lines)
+        return buf.getvalue()
     
     def _extract_code_snippets(
         self, 
         documentation: str, 
-        structured_changes: Dict[str, Any]
-    ) -> List[Dict[str, str]]:
-        """Extract code snippets from documentation."""
-        snippets = []
+        change_snippets: SnippetBatch
+    ) -> SnippetBatch:
+        """Extract code snippets from documentation, followed by change_snippets."""
+        snippets = SnippetBatch()
         
         # Extract from markdown code blocks
-        import re
-        code_blocks = re.findall(r'```(\w+)?\n(.*?)```', documentation, re.DOTALL)
-        
-        for i, (lang, code) in enumerate(code_blocks):
-            snippets.append({
-                'id': f'snippet_{i}',
-                'code': code.strip(),
-                'language': lang or 'python',
-                'source': 'documentation'
-            })
+        code_blocks = _iter_code_blocks(documentation)
+        
+        for i, (lang, code, _) in enumerate(code_blocks):
+            code, language = _block_code_and_language(lang, code)
+            snippets.append(f'snippet_{i}', code, language, 'documentation')
         
-        # Also include snippets from structured changes
-        for change in structured_changes.get('changes', []):
+        snippets.extend(change_snippets)
+        return snippets
+    
+    def _snippets_from_changes(self, changes: List[Dict[str, Any]]) -> SnippetBatch:
+        """Collect the added code of each structured change as a snippet."""
+        snippets = SnippetBatch()
+        for change in changes:
             added_code = change.get('code_snippets', {}).get('added', [])
             if added_code:
-                snippets.append({
-                    'id': f'change_{change["file_path"]}',
-                    'code': '\n'.join(added_code[:20]),
-                    'language': change.get('language', 'python'),
-                    'source': 'code_change'
-                })
+                snippets.append(
+                    f'change_{change["file_path"]}',
+                    '\n'.join(added_code[:20]),
+                    change.get('language', 'python'),
+                    'code_change'
+                )
         
         return snippets
     
     def _execute_code_snippets(
         self, 
-        code_snippets: List[Dict[str, str]]
-    ) -> List[Dict[str, Any]]:
-        """Execute code snippets using Daytona."""
-        results = self.daytona.execute_code_snippets(code_snippets)
+        code_snippets: SnippetBatch,
+        started: Optional[Dict[Tuple[str, str], Future]] = None
+    ) -> List[ExecResult]:
+        """
+        Execute code snippets using Daytona.
+        
+        Args:
+            code_snippets: Snippets to execute
+            started: Executions already submitted, keyed by (code, language)
+            
+        Returns:
+            One ExecResult per snippet, in batch order
+        """
+        started = started or {}
+        keys = list(zip(code_snippets.codes, code_snippets.languages))
+        pending = SnippetBatch()
+        for snippet_id, key in zip(code_snippets.ids, keys):
+            if key not in started:
+                pending.append(snippet_id, *key)
+        # Results come back in batch order and are consumed in that order below
+        results = iter(self.daytona.execute_batch(pending))
         
         # Format results
+        used = set()
         formatted_results = []
-        for snippet in code_snippets:
-            snippet_id = snippet['id']
-            result = results.get(snippet_id)
+        for snippet_id, key in zip(code_snippets.ids, keys):
+            if key in started:
+                used.add(key)
+                result = started[key].result()
+            else:
+                result = next(results)
             
-            formatted_results.append({
-                'id': snippet_id,
-                'code': snippet['code'],
-                'language': snippet['language'],
-                'execution_result': {
-                    'success': result.success if result else False,
-                    'exit_code': result.exit_code if result else -1,
-                    'output': result.output if result else '',
-                    'error': result.error if result else None
-                } if result else None
-            })
+            formatted_results.append(ExecResult(
+                snippet_id,
+                key[0],
+                key[1],
+                result.success,
+                result.exit_code,
+                result.output,
+                result.error
+            ))
+        
+        # Blocks from a response that was later replaced by the fallback
+        for key, future in started.items():
+            if key not in used:
+                future.cancel()
         
         return formatted_results
     
     def _self_correct(
         self,
         documentation: str,
-        structured_changes: Dict[str, Any],
+        changes_json: str,
         evaluation: Any,
-        execution_results: List[Dict[str, Any]]
+        execution_results: List[ExecResult]
     ) -> tuple[str, Any]:
         """Self-correction loop using Gemini."""
+        # Without Gemini the document never changes, and re-evaluating the same
+        # text yields the same score
+        if not self.gemini_client:
+            return documentation, evaluation
+        
         attempts = 0
-        max_attempts = config.max_self_correction_attempts
+        max_attempts = self.config.max_self_correction_attempts
         
-        while attempts < max_attempts and evaluation.overall_score < config.min_doc_quality_score:
+        while attempts < max_attempts and evaluation.overall_score < self.config.min_doc_quality_score:
             attempts += 1
             
             # Create correction prompt
-            correction_prompt = f"""The following documentation was evaluated and received a score of {evaluation.overall_score:.2f}.
-
-Issues identified:
-{chr(10).join(evaluation.issues)}
-
-Feedback:
-{chr(10).join(evaluation.feedback)}
-
-Original documentation:
-{documentation}
-
-Please revise the documentation to address these issues. Generate improved documentation:"""
+            correction_prompt = _CORRECTION_TEMPLATE.format_map({
+                'score': evaluation.overall_score,
+                'issues': '\n'.join(evaluation.issues),
+                'feedback': '\n'.join(evaluation.feedback),
+                'documentation': documentation
+            })
             
-            if self.gemini_client:
-                try:
-                    response = self.gemini_client.generate_content(correction_prompt)
-                    documentation = response.text
-                except Exception as e:
-                    sys.stderr.write(f"Error in self-correction: {e}\n")
-                    sys.stderr.flush()
-                    break
+            try:
+                response = self.gemini_client.generate_content(correction_prompt)
+                documentation = response.text
+            except Exception as e:
+                sys.stderr.write(f"Error in self-correction: {e}\n")
+                sys.stderr.flush()
+                break
             
             # Re-evaluate
             evaluation = self.galileo.evaluate_documentation(
                 documentation,
-                code_context=json.dumps(structured_changes),
+                code_context=changes_json,
                 code_snippets=execution_results
             )
         
         return documentation, evaluation
     
-    def _determine_doc_path(self, structured_changes: Dict[str, Any]) -> str:
+    def _determine_doc_path(self, changes: List[Dict[str, Any]]) -> str:
         """Determine documentation file path based on changes."""
-        changes = structured_changes.get('changes', [])
         if not changes:
             return "README.md"
         
@@ -279,5 +454,75 @@ Please revise the documentation to address these issues. Generate improved docum
     
     def cleanup(self):
         """Cleanup resources."""
-        self.daytona.cleanup()
+        # Nothing to clean up if the sandbox server was never created
+        if self._daytona is not None:
+            self._daytona.cleanup()
+
+
+def _canonical_changes_json(structured_changes: Dict[str, Any]) -> str:
+    """
+    Serialize structured changes compactly, with sorted keys, for the prompt.
+    
+    Added-line snippets are cut to _PROMPT_SNIPPET_LINES. Cache keys hash the
+    full structure instead (see changes_cache_key), so two change sets that
+    differ only past the cut never share a cached update.
+    """
+    changes = []
+    for change in structured_changes.get('changes', []):
+        snippets = change.get('code_snippets', {})
+        added = snippets.get('added', [])
+        if len(added) > _PROMPT_SNIPPET_LINES:
+            change = dict(change, code_snippets=dict(snippets, added=added[:_PROMPT_SNIPPET_LINES]))
+        changes.append(change)
+    canonical = dict(structured_changes, changes=changes)
+    return orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS).decode()
+
+
+def _empty_update() -> DocumentationUpdate:
+    """Return the placeholder update used when there is nothing to document."""
+    return DocumentationUpdate(
+        file_path="DOCUMENTATION.md",
+        content="# Documentation\n\nNo code changes detected to document.",
+        code_snippets=[],
+        evaluation_score=0.5,
+        ready_to_commit=False
+    )
+
+
+def _iter_code_blocks(documentation: str, pos: int = 0) -> Iterator[Tuple[str, str, int]]:
+    """
+    Yield fenced code blocks as (language tag, body, end offset).
+    
+    A block is ``` followed by an optional word-character tag, a newline,
+    and the body up to the next ```. Scanning is linear: every search
+    resumes where the previous one stopped, and an unterminated block ends
+    the scan.
+    
+    Args:
+        documentation: Markdown text
+        pos: Offset to start scanning from
+    """
+    find = documentation.find
+    length = len(documentation)
+    while True:
+        start = find('```', pos)
+        if start < 0:
+            return
+        tag_start = tag_end = start + 3
+        while tag_end < length and (documentation[tag_end].isalnum() or documentation[tag_end] == '_'):
+            tag_end += 1
+        if tag_end < length and documentation[tag_end] == '\n':
+            end = find('```', tag_end + 1)
+            if end < 0:
+                return
+            pos = end + 3
+            yield documentation[tag_start:tag_end], documentation[tag_end + 1:end], pos
+        else:
+            # Not an opening fence; a fence may still start inside this run
+            pos = start + 1
+
+
+def _block_code_and_language(lang: str, code: str) -> Tuple[str, str]:
+    """Normalize a matched code block into the (code, language) it runs as."""
+    return code.strip(), lang or 'python'
 
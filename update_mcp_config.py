@@ -3,10 +3,13 @@
 This script helps update your Cursor MCP configuration file to include
 the Live Document Editor MCP server.
 """
-import json
+import functools
 import os
 from pathlib import Path
 
+import orjson
+
+@functools.lru_cache(maxsize=1)
 def get_mcp_config_path():
     """Get the path to Cursor MCP configuration file."""
     if os.name == 'nt':  # Windows
@@ -33,8 +36,7 @@ def update_mcp_config():
     
     # Read existing config or create new
     if config_path.exists():
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        config = orjson.loads(config_path.read_bytes())
     else:
         config = {"mcpServers": {}}
     
@@ -51,8 +53,7 @@ def update_mcp_config():
     
     # Write updated config
     config_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
+    config_path.write_bytes(orjson.dumps(config, option=orjson.OPT_INDENT_2))
     
     print(f"Updated MCP configuration at: {config_path}")
     print(f"   MCP server path: {mcp_server_str}")